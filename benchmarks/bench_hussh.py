@@ -1,71 +1,51 @@
-import json
-from pathlib import Path
 from pprint import pprint
-import timeit
+import time
 
-import memray
+from common import PAYLOAD_FILES, load_payloads, load_target, parse_args, save_results, tracker
 
-results_dict = {}
 
-if (mem_path := Path("memray-bench_hussh.bin")).exists():
-    mem_path.unlink()
-with memray.Tracker("memray-bench_hussh.bin"):
-    start_time = timeit.default_timer()
-    from hussh import Connection
+def run(host_info, payloads, profile=False):
+    """Benchmark hussh against the target server and return the results."""
+    # hussh's data writes take text
+    payloads = {name: data.decode() for name, data in payloads.items()}
+    results_dict = {}
 
-    results_dict["import_time"] = f"{(timeit.default_timer() - start_time) * 1000:.2f} ms"
+    with tracker("hussh", profile):
+        start_time = time.perf_counter_ns()
+        from hussh import Connection
 
-    host_info = json.loads(Path("target.json").read_text())
+        results_dict["import_time"] = (time.perf_counter_ns() - start_time) / 1e6
 
-    temp_time = timeit.default_timer()
-    conn = Connection(
-        host=host_info["host"],
-        port=host_info["port"],
-        password=host_info["password"],
-    )
-    results_dict["connect_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
+        temp_time = time.perf_counter_ns()
+        conn = Connection(
+            host=host_info["host"],
+            port=host_info["port"],
+            password=host_info["password"],
+        )
+        results_dict["connect_time"] = (time.perf_counter_ns() - temp_time) / 1e6
 
-    temp_time = timeit.default_timer()
-    result = conn.execute("echo test")
-    results_dict["cmd_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
+        temp_time = time.perf_counter_ns()
+        conn.execute("echo test")
+        results_dict["cmd_time"] = (time.perf_counter_ns() - temp_time) / 1e6
 
-    # small file (1kb)
-    temp_time = timeit.default_timer()
-    conn.sftp_write("1kb.txt", "/root/1kb.txt")
-    results_dict["s_put_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
+        for size, name in PAYLOAD_FILES.items():
+            remote_path = f"/root/{name}"
+            temp_time = time.perf_counter_ns()
+            conn.sftp_write_data(payloads[name], remote_path)
+            results_dict[f"{size}_put_time"] = (time.perf_counter_ns() - temp_time) / 1e6
 
-    temp_time = timeit.default_timer()
-    conn.sftp_read("/root/1kb.txt", "small.txt")
-    results_dict["s_get_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
-    Path("small.txt").unlink()
+            temp_time = time.perf_counter_ns()
+            conn.sftp_read(remote_path)
+            results_dict[f"{size}_get_time"] = (time.perf_counter_ns() - temp_time) / 1e6
 
-    # medium file (14kb)
-    temp_time = timeit.default_timer()
-    conn.sftp_write("14kb.txt", "/root/14kb.txt")
-    results_dict["m_put_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
+        results_dict["total_time"] = (time.perf_counter_ns() - start_time) / 1e6
 
-    temp_time = timeit.default_timer()
-    conn.sftp_read("/root/14kb.txt", "medium.txt")
-    results_dict["m_get_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
-    Path("medium.txt").unlink()
+    return results_dict
 
-    # large file (64kb)
-    temp_time = timeit.default_timer()
-    conn.sftp_write("64kb.txt", "/root/64kb.txt")
-    results_dict["l_put_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
 
-    temp_time = timeit.default_timer()
-    conn.sftp_read("/root/64kb.txt", "large.txt")
-    results_dict["l_get_time"] = f"{(timeit.default_timer() - temp_time) * 1000:.2f} ms"
-    Path("large.txt").unlink()
-
-    results_dict["total_time"] = f"{(timeit.default_timer() - start_time) * 1000:.2f} ms"
-
-pprint(results_dict, sort_dicts=False)
-
-if Path("bench_results.json").exists():
-    results = json.loads(Path("bench_results.json").read_text())
-else:
-    results = {}
-results.update({"hussh": results_dict})
-Path("bench_results.json").write_text(json.dumps(results, indent=2))
+if __name__ == "__main__":
+    args = parse_args()
+    results_dict = run(load_target(), load_payloads(), args.profile)
+    pprint(results_dict, sort_dicts=False)
+    if not args.profile:
+        save_results("hussh", results_dict)
@@ -0,0 +1,59 @@
+"""Helpers shared by the bench_*.py scripts."""
+
+import argparse
+from contextlib import nullcontext
+from functools import cache
+from pathlib import Path
+
+# each payload file, keyed by the prefix of its put and get result names
+PAYLOAD_FILES = {"s": "1kb.txt", "m": "14kb.txt", "l": "64kb.txt"}
+
+
+def parse_args():
+    """Parse the command line options common to every benchmark script."""
+    parser = argparse.ArgumentParser(description="Run an ssh library benchmark.")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="track memory with memray; timings from a profiled run are not saved",
+    )
+    return parser.parse_args()
+
+
+def tracker(lib, profile, **kwargs):
+    """Return a memray Tracker for the library when profiling, otherwise a no-op context."""
+    if not profile:
+        return nullcontext()
+    import memray
+
+    if (mem_path := Path(f"memray-bench_{lib}.bin")).exists():
+        mem_path.unlink()
+    return memray.Tracker(mem_path, **kwargs)
+
+
+@cache
+def load_target():
+    """Load the target server's connection information, reading target.json only once."""
+    # imported here so orjson isn't already loaded when a library's import is timed
+    import orjson
+
+    return orjson.loads(Path("target.json").read_bytes())
+
+
+@cache
+def load_payloads():
+    """Read the transfer payloads into memory once, so puts don't time local disk reads."""
+    return {name: Path(name).read_bytes() for name in PAYLOAD_FILES.values()}
+
+
+def save_results(lib, results_dict):
+    """Write a library's results to its own bench_results_<lib>.json.
+
+    Each library gets a separate file, so benchmarks running at the same time
+    never read or rewrite each other's results.
+    """
+    import orjson
+
+    Path(f"bench_results_{lib}.json").write_bytes(
+        orjson.dumps(results_dict, option=orjson.OPT_INDENT_2)
+    )
@@ -1,50 +1,135 @@
-import json
+import argparse
+from functools import partial
+import importlib.util
+import multiprocessing
+from operator import itemgetter
 from pathlib import Path
-import subprocess
+import time
 
-from rich.console import Console
-from rich.table import Table
+from common import load_payloads, load_target
 
+# every spawned benchmark process re-imports this module, so anything imported at the top
+# is already loaded when a library's import time is measured. Import the rest where it's used.
 
-def run_all():
-    """Find all the python files in this directory starting with bench_ and run them."""
-    for file in Path(__file__).parent.glob("bench_*.py"):
-        print(f"Running {file}")
-        subprocess.run(["python", file], check=True)
+
+def wait_for_target(host_info, timeout=10):
+    """Wait until the target sshd sends its banner, so a freshly started server isn't benchmarked.
+
+    Docker's port proxy accepts connections before sshd is up, so a bare connect isn't enough.
+    """
+    import socket
+
+    address = (host_info["host"], host_info["port"])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(address, timeout=0.25) as sock:
+                if sock.recv(4) == b"SSH-":
+                    return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise ConnectionError(f"no ssh server at {address[0]}:{address[1]} after {timeout}s")
+
+
+def run_benchmark(file, host_info, payloads, profile=False):
+    """Load a benchmark script as a module and return the results of its run function."""
+    spec = importlib.util.spec_from_file_location(file.stem, file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.run(host_info, payloads, profile)
+
+
+def run_isolated(file, host_info, payloads, profile=False):
+    """Run a benchmark in a freshly spawned interpreter, so every import is a cold one."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_benchmark, (file, host_info, payloads, profile))
+
+
+def bench_library(file, repeat, host_info, payloads):
+    """Time a library's benchmark `repeat` times, then run it once more under memray.
+
+    The median of each timing is returned, and the profiler's overhead never shows up in them.
+    """
+    import statistics
+
+    print(f"Running {file}")
+    runs = [run_isolated(file, host_info, payloads) for _ in range(repeat)]
+    print(f"Profiling {file}")
+    run_isolated(file, host_info, payloads, profile=True)
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def run_all(repeat, parallel=False):
+    """Find all the python files in this directory starting with bench_ and run them.
+
+    With `parallel`, every library is benchmarked at the same time in its own process.
+    This is much faster, but the libraries then compete for the client and server.
+    The target and payloads are read once here and handed to every run.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    host_info, payloads = load_target(), load_payloads()
+    wait_for_target(host_info)
+    files = list(Path(__file__).parent.glob("bench_*.py"))
+    libs = [file.stem.replace("bench_", "") for file in files]
+    # each benchmark already runs in its own spawned process, so threads are enough to overlap them
+    with ThreadPoolExecutor(max_workers=len(files) if parallel else 1) as executor:
+        bench = partial(bench_library, repeat=repeat, host_info=host_info, payloads=payloads)
+        results = executor.map(bench, files)
+        return dict(zip(libs, results, strict=True))
 
 
 def run_memray_reports(report_dict):
-    """Find all memray reports, run them, then delete them."""
+    """Find all memray reports, read their stats, then delete them."""
+    from memray import FileReader
+
     for file in Path(__file__).parent.glob("memray-*.bin"):
         # Figure out what library we're looking at
         lib = file.stem.replace("memray-bench_", "")
-        json_file = Path(f"{lib}.json")
-        subprocess.run(["memray", "stats", "--json", file, "-o", str(json_file)], check=True)
+        reader = FileReader(file)
+        report_dict[lib]["peak_memory"] = reader.metadata.peak_memory / 1024 / 1024
+        report_dict[lib]["allocations"] = reader.metadata.total_allocations
+        reader.close()
         file.unlink()
-        # load the new json file
-        results = json.loads(json_file.read_text())
-        report_dict[lib]["peak_memory"] = (
-            f'{results["metadata"]["peak_memory"] / 1024 / 1024:.2f} MB'
-        )
-        report_dict[lib]["allocations"] = str(results["metadata"]["total_allocations"])
-        json_file.unlink()
+
+
+def format_value(key, value):
+    """Format a raw numeric result for display, based on the metric it belongs to."""
+    if key.endswith("_time"):
+        return f"{value:.2f} ms"
+    if key == "peak_memory":
+        return f"{value:.2f} MB"
+    return str(value)
 
 
 def print_report(report_dict):
     """Print out the report in a rich table"""
-    report_table = Table(title="Benchmark Report")
+    from rich.console import Console
+    from rich.table import Table
+
+    report_table = Table(title="Benchmark Report", expand=False, show_lines=False)
+    # Every row is laid out by the same column keys, regardless of each library's key order
+    keys = list(report_dict["hussh"])
+    get_values = itemgetter(*keys)
     # Add the columns
     report_table.add_column("Library")
-    for key in report_dict["hussh"]:
+    for key in keys:
         report_table.add_column(key)
-    for lib in report_dict:
-        report_table.add_row(lib, *[report_dict[lib][key] for key in report_dict[lib]])
+    for lib, results in report_dict.items():
+        report_table.add_row(lib, *map(format_value, keys, get_values(results)))
     Console().print(report_table)
 
 
 if __name__ == "__main__":
-    run_all()
-    report_dict = json.loads(Path("bench_results.json").read_text())
+    parser = argparse.ArgumentParser(description="Run and report on all ssh library benchmarks.")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="number of timed runs per library (default: 5)"
+    )
+    parser.add_argument(
+        "--parallel", action="store_true", help="benchmark all libraries at the same time"
+    )
+    args = parser.parse_args()
+    report_dict = run_all(args.repeat, args.parallel)
     run_memray_reports(report_dict)
     print_report(report_dict)
-    Path("bench_results.json").unlink()
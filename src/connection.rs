@@ -59,8 +59,9 @@ use pyo3::exceptions::PyTimeoutError;
 use pyo3::prelude::*;
 use ssh2::{Channel, Session};
 use std::io::{BufReader, BufWriter, Read, Seek, Write};
-use std::net::TcpStream;
+use std::net::{TcpStream, ToSocketAddrs};
 use std::path::Path;
+use std::time::Duration;
 
 const MAX_BUFF_SIZE: usize = 65536;
 create_exception!(
@@ -83,6 +84,23 @@ fn read_from_channel(channel: &mut Channel) -> SSHResult {
     }
 }
 
+// Connect to the first address the host resolves to that accepts within the timeout
+fn connect_with_timeout(conn_str: &str, timeout: Duration) -> std::io::Result<TcpStream> {
+    let mut last_err = None;
+    for addr in conn_str.to_socket_addrs()? {
+        match TcpStream::connect_timeout(&addr, timeout) {
+            Ok(stream) => return Ok(stream),
+            Err(e) => last_err = Some(e),
+        }
+    }
+    Err(last_err.unwrap_or_else(|| {
+        std::io::Error::new(
+            std::io::ErrorKind::InvalidInput,
+            "could not resolve to any addresses",
+        )
+    }))
+}
+
 #[pyclass]
 #[derive(Clone)]
 pub struct SSHResult {
@@ -241,12 +259,19 @@ impl Connection {
         let port = port.unwrap_or(22);
         // combine the host and port into a single string
         let conn_str = format!("{}:{}", host, port);
-        let tcp_conn = TcpStream::connect(conn_str)
-            .map_err(|e| PyErr::new::<PyTimeoutError, _>(format!("{}", e)))?;
-        let mut session = Session::new().unwrap();
-        // if a timeout is set, use it
+        // if a timeout is set, use it for the tcp connection as well as the session
         let timeout = timeout.unwrap_or(0);
+        let tcp_conn = if timeout > 0 {
+            connect_with_timeout(&conn_str, Duration::from_millis(timeout.into()))
+        } else {
+            TcpStream::connect(&conn_str)
+        }
+        .map_err(|e| PyErr::new::<PyTimeoutError, _>(format!("{}", e)))?;
+        let mut session = Session::new().unwrap();
         session.set_timeout(timeout);
+        // ssh already sends whole packets, so Nagle's algorithm only delays them
+        // this is just an optimization, so don't fail the connection if it can't be set
+        let _ = tcp_conn.set_nodelay(true);
         session.set_tcp_stream(tcp_conn);
         session
             .handshake()
@@ -439,18 +464,12 @@ impl Connection {
 
     // Copy a file from this connection to another connection
     fn remote_copy(
-        &self,
+        &mut self,
         source_path: String,
         dest_conn: &mut Connection,
         dest_path: Option<String>,
     ) -> PyResult<()> {
-        let mut remote_file = BufReader::new(
-            self.session
-                .sftp()
-                .unwrap()
-                .open(Path::new(&source_path))
-                .unwrap(),
-        );
+        let mut remote_file = BufReader::new(self.sftp().open(Path::new(&source_path)).unwrap());
         let dest_path = dest_path.unwrap_or_else(|| source_path.clone());
         let mut other_file = dest_conn.sftp().create(Path::new(&dest_path)).unwrap();
         let mut buffer = vec![0; MAX_BUFF_SIZE];
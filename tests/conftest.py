@@ -2,68 +2,162 @@
 
 import os
 from pathlib import PurePath
+import re
+import socket
 import subprocess
 import time
 
-import docker
-import pexpect
+from filelock import FileLock
 import pytest
 
 TESTDIR = PurePath(__file__).parent
+# under pytest-xdist, each worker (gw0, gw1, ...) runs its own containers on its own ports
+XDIST_WORKER = os.environ.get("PYTEST_XDIST_WORKER", "")
+PORT_OFFSET = int(XDIST_WORKER[2:] or 0) * 10
+# matches the "NAME=value;" assignments in `ssh-agent -s` output
+AGENT_ENV_PATTERN = re.compile(r"^(SSH_[A-Z_]+)=([^;\n]+);", re.MULTILINE)
+# ssh-add's prompt for a key's passphrase
+PASSPHRASE_PROMPT = re.compile(rb"Enter passphrase for .*: ")
+
+
+def pytest_addoption(parser):
+    """Add hussh's test options to pytest."""
+    parser.addoption(
+        "--keep-containers",
+        action="store_true",
+        help="leave the test server containers running after the session, for reuse next run",
+    )
+    parser.addoption("--run-perf", action="store_true", help="run the transfer throughput tests")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip the perf tests unless --run-perf was passed."""
+    if config.getoption("run_perf"):
+        return
+    skip_perf = pytest.mark.skip(reason="perf tests only run with --run-perf")
+    for item in items:
+        if "perf" in item.keywords:
+            item.add_marker(skip_perf)
+
+
+def container_name(base):
+    """Return the container name for the current xdist worker, if any."""
+    return f"{base}-{XDIST_WORKER}" if XDIST_WORKER else base
 
 
 @pytest.fixture(scope="session")
-def ensure_test_server_image():
-    """Ensure that the test server Docker image is available."""
+def docker_client():
+    """Return a Docker client shared by every fixture in the session."""
+    # docker and pexpect are imported where they're used, so --collect-only doesn't pay for them
+    import docker
+
     client = docker.from_env()
-    try:
-        client.images.get("hussh-test-server")
-    except docker.errors.ImageNotFound:
-        client.images.build(
-            path=str(TESTDIR / "setup"),
-            tag="hussh-test-server",
-        )
+    yield client
     client.close()
 
 
-@pytest.fixture(scope="session", autouse=True)
-def run_test_server(ensure_test_server_image):
-    """Run a test server in a Docker container."""
-    client = docker.from_env()
-    try:  # check to see if the container is already running
-        container = client.containers.get("hussh-test-server")
-    except docker.errors.NotFound:  # if not, start it
+@pytest.fixture(scope="session")
+def ensure_test_server_image(docker_client, tmp_path_factory):
+    """Ensure that the test server Docker image is available.
+
+    Set HUSSH_SKIP_IMAGE_CHECK when the image is known to exist, e.g. built by an earlier CI step.
+    """
+    if os.environ.get("HUSSH_SKIP_IMAGE_CHECK"):
+        return
+    from docker.errors import ImageNotFound
+
+    # xdist workers share the parent of their base temp dirs, so only one of them builds the image
+    with FileLock(tmp_path_factory.getbasetemp().parent / "hussh-test-server.lock"):
+        try:
+            docker_client.images.get("hussh-test-server")
+        except ImageNotFound:
+            docker_client.images.build(
+                path=str(TESTDIR / "setup"),
+                tag="hussh-test-server",
+            )
+
+
+@pytest.fixture(scope="session")
+def server_port():
+    """Return the host port of the main test server."""
+    return 8022 + PORT_OFFSET
+
+
+@pytest.fixture(scope="session")
+def second_server_port():
+    """Return the host port of the second test server."""
+    return 8023 + PORT_OFFSET
+
+
+def wait_for_ssh(port, timeout=15):
+    """Wait until an ssh server is answering with its banner on the given local port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.25) as sock:
+                if sock.recv(4) == b"SSH-":
+                    return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"ssh server on port {port} not ready after {timeout} seconds")
+
+
+@pytest.fixture(scope="session")
+def existing_containers(docker_client):
+    """Return the test server containers that already exist, keyed by name."""
+    containers = docker_client.containers.list(all=True, filters={"name": "hussh-test-server"})
+    return {container.name: container for container in containers}
+
+
+def start_container(client, existing, name, port):
+    """Return the named test server container, starting it first if needed."""
+    container = existing.get(name)
+    if container is None:  # no container yet, so create one
         container = client.containers.run(
             "hussh-test-server",
             detach=True,
-            ports={"22/tcp": 8022},
-            name="hussh-test-server",
+            # only listen on loopback, the test servers shouldn't be reachable from the network
+            ports={"22/tcp": ("127.0.0.1", port)},
+            name=name,
         )
-        time.sleep(5)  # give the server time to start
+    elif container.status == "running":
+        return container
+    else:
+        container.start()
+    wait_for_ssh(port)
+    return container
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_test_server(
+    pytestconfig, docker_client, existing_containers, ensure_test_server_image, server_port
+):
+    """Run a test server in a Docker container."""
+    container = start_container(
+        docker_client, existing_containers, container_name("hussh-test-server"), server_port
+    )
     yield container
-    container.stop()
-    container.remove()
-    client.close()
+    if not pytestconfig.getoption("keep_containers"):
+        container.stop()
+        container.remove()
 
 
 @pytest.fixture(scope="session")
-def run_second_server(ensure_test_server_image):
-    """Run a test server in a Docker container."""
-    client = docker.from_env()
-    try:  # check to see if the container is already running
-        container = client.containers.get("hussh-test-server2")
-    except docker.errors.NotFound:  # if not, start it
-        container = client.containers.run(
-            "hussh-test-server",
-            detach=True,
-            ports={"22/tcp": 8023},
-            name="hussh-test-server2",
-        )
-        time.sleep(5)  # give the server time to start
+def run_second_server(
+    pytestconfig, docker_client, existing_containers, ensure_test_server_image, second_server_port
+):
+    """Run a second test server in a Docker container."""
+    container = start_container(
+        docker_client,
+        existing_containers,
+        container_name("hussh-test-server2"),
+        second_server_port,
+    )
     yield container
-    container.stop()
-    container.remove()
-    client.close()
+    if not pytestconfig.getoption("keep_containers"):
+        container.stop()
+        container.remove()
 
 
 @pytest.fixture(scope="session")
@@ -74,7 +168,7 @@ def setup_agent_auth():
 
     # Start the ssh-agent and get the environment variables
     output = subprocess.check_output(["ssh-agent", "-s"])
-    env = dict(line.split("=", 1) for line in output.decode().splitlines() if "=" in line)
+    env = dict(AGENT_ENV_PATTERN.findall(output.decode()))
 
     # Set the SSH_AUTH_SOCK and SSH_AGENT_PID environment variables
     os.environ["SSH_AUTH_SOCK"] = env["SSH_AUTH_SOCK"]
@@ -88,8 +182,10 @@ def setup_agent_auth():
     print(result.stdout)
     print(result.stderr)
     # The auth_key is password protected
+    import pexpect
+
     child = pexpect.spawn("ssh-add", [str(auth_key)])
-    child.expect("Enter passphrase for .*: ")
+    child.expect(PASSPHRASE_PROMPT)
     child.sendline("husshpuppy")
     yield
     # Kill the ssh-agent after the tests have run
@@ -1,45 +1,77 @@
 """Tests for hussh.connection module."""
 
+import filecmp
+import hashlib
 from pathlib import Path
+import shlex
+import time
 
 import pytest
 
 from hussh import Connection, SSHResult
 
-TEXT_FILE = Path("tests/data/hp.txt").resolve()
-IMG_FILE = Path("tests/data/puppy.jpeg").resolve()
-
-
-@pytest.fixture
-def conn():
-    """Return a basic Connection object."""
-    return Connection(host="localhost", port=8022, password="toor")
-
-
-def test_password_auth():
-    """Test that we can establish a connection with password-based authentication."""
-    assert Connection(host="localhost", port=8022, password="toor")
-
-
-def test_key_auth():
-    """Test that we can establish a connection with key-based authentication."""
-    assert Connection(host="localhost", port=8022, private_key="tests/data/test_key")
-
-
-def test_key_with_password_auth():
-    """Test that we can establish a connection with key-based authentication and a password."""
-    assert Connection(
-        host="localhost",
-        port=8022,
-        private_key="tests/data/auth_test_key",
-        password="husshpuppy",
-    )
+# __file__ is already absolute, so these need no resolve() and work from any directory
+DATA_DIR = Path(__file__).parent / "data"
+TEXT_FILE = DATA_DIR / "hp.txt"
+IMG_FILE = DATA_DIR / "puppy.jpeg"
+# the Connection methods take paths as strings
+TEXT_FILE_STR = str(TEXT_FILE)
+IMG_FILE_STR = str(IMG_FILE)
+HP_TEXT = TEXT_FILE.read_text()
+HP_SHA256 = hashlib.sha256(TEXT_FILE.read_bytes()).hexdigest()
+# a floor far below localhost speeds, only meant to catch large sftp throughput regressions
+MIN_MBPS = 10
+
+
+def assert_uploaded(conn, remote_path, expected_sha256):
+    """Assert that a remote file exists with the expected contents, in a single command."""
+    result = conn.execute(f"sha256sum {shlex.quote(remote_path)}")
+    assert result.status == 0, result.stderr
+    assert result.stdout.split()[0] == expected_sha256
+
+
+@pytest.fixture(scope="module")
+def img_bytes():
+    """Return the test image's contents, only read when a test asks for it."""
+    return IMG_FILE.read_bytes()
+
+
+@pytest.fixture(scope="module")
+def conn(run_test_server, server_port):
+    """Return a basic Connection object, shared by every test in this module."""
+    connection = Connection(host="localhost", port=server_port, password="toor")
+    # clear out files from earlier runs once, since each test writes to paths no other test uses
+    connection.execute("rm -f /root/*.txt /root/*.jpeg")
+    return connection
+
+
+@pytest.fixture(scope="module")
+def dest_conn(run_second_server, second_server_port):
+    """Return a Connection to the second test server, shared by every test in this module."""
+    connection = Connection(host="localhost", port=second_server_port, password="toor")
+    # clear out files left by an interrupted earlier run, so a stale copy can't pass for a new one
+    connection.execute("rm -f /root/*.txt")
+    return connection
+
+
+@pytest.mark.parametrize(
+    "auth_kwargs",
+    [
+        {"password": "toor"},
+        {"private_key": str(DATA_DIR / "test_key")},
+        {"private_key": str(DATA_DIR / "auth_test_key"), "password": "husshpuppy"},
+    ],
+    ids=["password", "key", "key_with_password"],
+)
+def test_auth(server_port, auth_kwargs):
+    """Test that we can establish a connection with password, key, and passphrase key auth."""
+    assert Connection(host="localhost", port=server_port, **auth_kwargs)
 
 
 @pytest.mark.skip("fixture-based setup for agent-based auth currently not working")
-def test_agent_auth(setup_agent_auth):
+def test_agent_auth(setup_agent_auth, server_port):
     """Test that we can establish a connection with agent-based authentication."""
-    assert Connection(host="localhost", port=8022)
+    assert Connection(host="localhost", port=server_port)
 
 
 def test_basic_command(conn):
@@ -57,131 +89,114 @@ def test_bad_command(conn):
     assert "command not found" in result.stderr
 
 
-def test_text_scp(conn):
+@pytest.mark.parametrize("proto", ["scp", "sftp"])
+def test_text_transfer(conn, tmp_path, proto):
     """Test that we can copy a file to the server and read it back."""
+    write = getattr(conn, f"{proto}_write")
+    read = getattr(conn, f"{proto}_read")
+    # each protocol gets its own remote file, so neither can pass on the other's upload
+    remote_path = f"/root/{proto}_hp.txt"
     # copy a local file to the server
-    conn.scp_write(str(TEXT_FILE), "/root/hp.txt")
-    assert "hp.txt" in conn.execute("ls /root").stdout
+    write(TEXT_FILE_STR, remote_path)
+    assert_uploaded(conn, remote_path, HP_SHA256)
     # read the file back from the server
-    read_text = conn.scp_read("/root/hp.txt")
-    hp_text = Path(str(TEXT_FILE)).read_text()
-    assert read_text == hp_text
+    read_text = read(remote_path)
+    assert read_text == HP_TEXT
     # copy the file from the server to a local file
-    conn.scp_read("/root/hp.txt", "scp_hp.txt")
-    scp_hp_text = Path("scp_hp.txt").read_text()
-    Path("scp_hp.txt").unlink()
-    assert scp_hp_text == hp_text
+    local_path = tmp_path / f"{proto}_hp.txt"
+    read(remote_path, str(local_path))
+    assert filecmp.cmp(local_path, TEXT_FILE, shallow=False)
 
 
-def test_scp_write_data(conn):
+@pytest.mark.parametrize("proto", ["scp", "sftp"])
+def test_write_data(conn, proto):
     """Test that we can write a string to a file on the server."""
-    conn.scp_write_data("hello", "/root/hello.txt")
-    assert "hello.txt" in conn.execute("ls /root").stdout
-    read_text = conn.scp_read("/root/hello.txt")
+    remote_path = f"/root/{proto}_hello.txt"
+    getattr(conn, f"{proto}_write_data")("hello", remote_path)
+    read_text = getattr(conn, f"{proto}_read")(remote_path)
     assert read_text == "hello"
 
 
-@pytest.mark.skip("non-text files are not supported by scp")
-def test_non_utf8_scp(conn):
+@pytest.mark.skip("non-text files are not supported by scp or sftp")
+@pytest.mark.parametrize("proto", ["scp", "sftp"])
+def test_non_utf8_transfer(conn, tmp_path, img_bytes, proto):
     """Test that we can copy a non-text file to the server and read it back."""
+    write = getattr(conn, f"{proto}_write")
+    read = getattr(conn, f"{proto}_read")
+    remote_path = f"/root/{proto}_puppy.jpeg"
     # copy an image file to the server
-    conn.scp_write(str(IMG_FILE), "/root/puppy.jpeg")
-    assert "puppy.jpeg" in conn.execute("ls /root").stdout
+    write(IMG_FILE_STR, remote_path)
+    assert_uploaded(conn, remote_path, hashlib.sha256(img_bytes).hexdigest())
     # read the file back from the server
-    read_img = conn.scp_read("/root/puppy.jpeg")
-    img_data = Path(str(IMG_FILE)).read_bytes()
-    assert read_img == img_data
+    read_img = read(remote_path)
+    assert read_img == img_bytes
     # copy the file from the server to a local file
-    conn.scp_read("/root/puppy.jpeg", "scp_puppy.jpeg")
-    scp_img_data = Path("scp_puppy.jpeg").read_bytes()
-    Path("scp_puppy.jpeg").unlink()
-    assert scp_img_data == img_data
-
-
-def test_text_sftp(conn):
-    """Test that we can copy a file to the server and read it back."""
-    # copy a local file to the server
-    conn.sftp_write(str(TEXT_FILE), "/root/hp.txt")
-    assert "hp.txt" in conn.execute("ls /root").stdout
-    # read the file back from the server
-    read_text = conn.sftp_read("/root/hp.txt")
-    hp_text = Path(str(TEXT_FILE)).read_text()
-    assert read_text == hp_text
-    # copy the file from the server to a local file
-    conn.sftp_read("/root/hp.txt", "sftp_hp.txt")
-    sftp_hp_text = Path("sftp_hp.txt").read_text()
-    Path("sftp_hp.txt").unlink()
-    assert sftp_hp_text == hp_text
-
-
-def test_sftp_write_data(conn):
-    """Test that we can write a string to a file on the server."""
-    conn.sftp_write_data("hello", "/root/hello.txt")
-    assert "hello.txt" in conn.execute("ls /root").stdout
-    read_text = conn.sftp_read("/root/hello.txt")
-    assert read_text == "hello"
-
-
-@pytest.mark.skip("non-text files are not supported by sftp")
-def test_non_utf8_sftp(conn):
-    """Test that we can copy a non-text file to the server and read it back."""
-    # copy an image file to the server
-    conn.sftp_write(str(IMG_FILE), "/root/puppy.jpeg")
-    assert "puppy.jpeg" in conn.execute("ls /root").stdout
-    # read the file back from the server
-    read_img = conn.sftp_read("/root/puppy.jpeg")
-    img_data = Path(str(IMG_FILE)).read_bytes()
-    assert read_img == img_data
-    # copy the file from the server to a local file
-    conn.sftp_read("/root/puppy.jpeg", "sftp_puppy.jpeg")
-    sftp_img_data = Path("sftp_puppy.jpeg").read_bytes()
-    Path("sftp_puppy.jpeg").unlink()
-    assert sftp_img_data == img_data
-
-
-def test_shell_context(conn):
-    """Test that we can run multiple commands in a shell context."""
-    with conn.shell() as sh:
+    local_path = tmp_path / f"{proto}_puppy.jpeg"
+    read(remote_path, str(local_path))
+    assert filecmp.cmp(local_path, IMG_FILE, shallow=False)
+
+
+@pytest.mark.perf
+def test_sftp_large_throughput(conn, tmp_path):
+    """Test that a large file makes an sftp round trip above a minimum throughput."""
+    size_mb = 64
+    local_file = tmp_path / "big.txt"
+    local_file.write_bytes(b"0123456789abcdef" * (size_mb * 1024 * 1024 // 16))
+    copy_file = tmp_path / "big_copy.txt"
+    start = time.perf_counter()
+    conn.sftp_write(str(local_file), "/root/big.txt")
+    conn.sftp_read("/root/big.txt", str(copy_file))
+    elapsed = time.perf_counter() - start
+    assert copy_file.stat().st_size == local_file.stat().st_size
+    # the file crosses the connection twice, once each way
+    assert elapsed < 2 * size_mb / MIN_MBPS
+
+
+@pytest.mark.parametrize("pty", [False, True], ids=["no_pty", "pty"])
+def test_shell_context(conn, pty):
+    """Test that we can run multiple commands in a shell context, with and without a pty."""
+    with conn.shell(pty=pty) as sh:
         sh.send("echo test shell")
         sh.send("bad command")
     assert "test shell" in sh.result.stdout
-    assert "command not found" in sh.result.stderr
+    # a pty merges stderr into stdout
+    assert "command not found" in (sh.result.stdout if pty else sh.result.stderr)
     assert sh.result.status != 0
 
 
-def test_pty_shell_context(conn):
-    """Test that we can run multiple commands in a pty shell context."""
-    with conn.shell(pty=True) as sh:
-        sh.send("echo test shell")
-        sh.send("bad command")
-    assert "test shell" in sh.result.stdout
-    assert "command not found" in sh.result.stdout
-    assert sh.result.status != 0
+def test_connection_timeout(server_port):
+    """Test that we can trigger a timeout on connect."""
+    with pytest.raises(TimeoutError):
+        Connection(host="localhost", port=server_port, password="toor", timeout=10)
 
 
-def test_connection_timeout():
-    """Test that we can trigger a timeout on connect."""
+def test_connect_timeout_unreachable_host():
+    """Test that the timeout also bounds the tcp connect to a host that never answers."""
+    start = time.perf_counter()
     with pytest.raises(TimeoutError):
-        Connection(host="localhost", port=8022, password="toor", timeout=10)
+        # 192.0.2.1 is reserved for documentation (RFC 5737), so nothing will ever answer
+        Connection(host="192.0.2.1", password="toor", timeout=10)
+    # an unbounded connect would only give up after the OS connect timeout, minutes later
+    assert time.perf_counter() - start < 1
 
 
-def test_remote_copy(conn, run_second_server):
+@pytest.mark.slow
+def test_remote_copy(conn, dest_conn):
     """Test that we can copy a file from one server to another."""
     # First copy the test file to the first server
-    conn.scp_write(str(TEXT_FILE), "/root/hp.txt")
-    assert "hp.txt" in conn.execute("ls /root").stdout
+    conn.scp_write(TEXT_FILE_STR, "/root/remote_copy_hp.txt")
     # Now copy the file from the first server to the second server
-    dest_conn = Connection(host="localhost", port=8023, password="toor")
-    conn.remote_copy("/root/hp.txt", dest_conn)
-    assert "hp.txt" in dest_conn.execute("ls /root").stdout
+    conn.remote_copy("/root/remote_copy_hp.txt", dest_conn)
+    # reading the copy back checks both that it arrived and that it arrived intact
+    assert dest_conn.sftp_read("/root/remote_copy_hp.txt") == HP_TEXT
 
 
 def test_tail(conn):
     """Test that we can tail a file."""
     TEST_STR = "hello\nworld\n"
-    conn.scp_write_data(TEST_STR, "/root/hello.txt")
-    with conn.tail("/root/hello.txt") as tf:
+    conn.scp_write_data(TEST_STR, "/root/tail.txt")
+    with conn.tail("/root/tail.txt") as tf:
         assert tf.read(0) == TEST_STR
         assert tf.last_pos == len(TEST_STR)
-        conn.execute("echo goodbye >> /root/hello.txt")
+        conn.execute("echo goodbye >> /root/tail.txt")
     assert tf.contents == "goodbye\n"